@@ -2,48 +2,76 @@ import os
 import shelve
 import time
 
+from contextlib import contextmanager
 from threading import Thread, RLock
 from queue import Queue, Empty
 from urllib.parse import urlparse
 
 from utils import get_logger, get_urlhash, normalize
 from scraper import is_valid
+from crawler.linkgraph import LinkGraph
+from crawler.robots import RobotsCache
+
+# recompute pagerank and save the link graph after this many new crawled pages
+GRAPH_SAVE_INTERVAL = 500
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
         
-        # lock to protect domainQueues, domainLastAccess, inProcessCount, and saved_hashes
+        # lock to protect domainQueues, domainLastAccess, inProcessCount, saved_hashes,
+        # refused_hashes, robotsInFlight and deferredUrls
         self.lock = RLock()
         self.domainQueues = {}   
         self.domainLastAccess = {} 
         self.inProcessCount = 0 
         self.saved_hashes = set()
+        # urls disallowed by robots.txt, so later links to them aren't checked again
+        self.refused_hashes = set()
+        self.graphSaved = False
+        # sitemap seeding threads and deferred retries still able to add urls
+        self.robotsInFlight = 0
+        # urls refused while a host's robots.txt was unavailable, url -> retry time.
+        # they are saved as (url, False, True) so a resumed crawl defers them again
+        self.deferredUrls = {}
+        self.nextDeferredRetry = float("inf")
 
         if os.path.exists(self.config.save_file) and restart:
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
             os.remove(self.config.save_file)
+
+        # link graph is persisted next to the frontier save file
+        self.linkGraph = LinkGraph(f"{self.config.save_file}.graph", restart)
+        # robots.txt rules per host, fetched through the cache server
+        self.robots = RobotsCache(config, self.logger, self._domain_slot)
         
         # shelve db for resuming crawl if interrupted
         with shelve.open(self.config.save_file) as save:
-            if not save:
-                self.logger.info(f"Did not find save file {self.config.save_file} (or it was empty), starting from seed.")
-                for url in self.config.seed_urls:
-                    self._add_url_to_save(save, url)
-            else:
+            fresh = not save
+            if not fresh:
                 self.logger.info(f"Loading state from {self.config.save_file}...")
                 self._parse_save_file(save)
+        if fresh:
+            self.logger.info(f"Did not find save file {self.config.save_file} (or it was empty), starting from seed.")
+            self.add_urls(self.config.seed_urls)
 
     # load old saved urls, add unfinished urls to queue
     def _parse_save_file(self, save):
         total_count = len(save)
-        for urlhash, (url, completed) in save.items():
+        tbd_count = 0
+        for urlhash, entry in save.items():
+            url, completed = entry[:2]
             self.saved_hashes.add(urlhash)
-            if not completed and is_valid(url):
+            if completed or not is_valid(url):
+                continue
+            # deferred on a robots.txt outage, so its host is checked again first
+            if len(entry) > 2 and entry[2]:
+                self._defer(url, time.time())
+            else:
                 self.addToDomainQueue(url)
-                tbd_count += 1
+            tbd_count += 1
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
@@ -57,6 +85,19 @@ class Frontier(object):
             self.saved_hashes.add(urlhash)
             self.addToDomainQueue(url)
 
+    # save a url refused while its host's robots.txt was unavailable, to retry later
+    def _defer_url_to_save(self, save, url, retryAt):
+        urlhash = get_urlhash(url)
+        if urlhash not in self.saved_hashes:
+            save[urlhash] = (url, False, True)
+            self.saved_hashes.add(urlhash)
+            self._defer(url, retryAt)
+            self.logger.info(f"Deferring {url}, robots.txt unavailable.")
+
+    def _defer(self, url, retryAt):
+        self.deferredUrls[url] = retryAt
+        self.nextDeferredRetry = min(self.nextDeferredRetry, retryAt)
+
     # group urls by domain for politeness and add to queue
     def addToDomainQueue(self, url):
         domain = urlparse(url).netloc
@@ -69,8 +110,11 @@ class Frontier(object):
         while True:
             with self.lock:
                 totalQueued = sum(len(q) for q in self.domainQueues.values())
-                if totalQueued == 0 and self.inProcessCount == 0:
-                    return None
+                if (totalQueued == 0 and self.inProcessCount == 0
+                        and self.robotsInFlight == 0 and not self.deferredUrls):
+                    saveGraph = not self.graphSaved
+                    self.graphSaved = True
+                    break
 
                 currentTime = time.time()
                 readyUrl = None
@@ -81,7 +125,8 @@ class Frontier(object):
                         continue
                     
                     lastAccess = self.domainLastAccess.get(domain, 0)
-                    if currentTime - lastAccess >= self.config.time_delay:
+                    delay = max(self.config.time_delay, self.robots.crawl_delay(domain))
+                    if currentTime - lastAccess >= delay:
                         readyUrl = queue.pop(0)
                         readyDomain = domain
                         break
@@ -90,17 +135,147 @@ class Frontier(object):
                     self.domainLastAccess[readyDomain] = time.time()
                     self.inProcessCount += 1
                     return readyUrl
+
+                retryUrls = None
+                if currentTime >= self.nextDeferredRetry:
+                    retryUrls = self._take_deferred(currentTime)
+                    self.robotsInFlight += 1
+
+            if retryUrls is not None:
+                # robots.txt may be downloaded again, so retry outside the lock
+                try:
+                    self._retry_deferred(retryUrls)
+                finally:
+                    with self.lock:
+                        self.robotsInFlight -= 1
+                continue
             time.sleep(0.1)
 
+        # only the first worker to find the frontier empty saves, outside the lock
+        if saveGraph:
+            self.linkGraph.save()
+        return None
+
     def add_url(self, url):
+        self.add_urls([url])
+
+    # add a batch of urls with one shelve open, robots.txt is checked
+    # outside the lock since it may have to be downloaded
+    def add_urls(self, urls):
         with self.lock:
-            url = normalize(url)
-            urlhash = get_urlhash(url)
-            if urlhash in self.saved_hashes:
+            newUrls = []
+            for url in urls:
+                url = normalize(url)
+                urlhash = get_urlhash(url)
+                if urlhash not in self.saved_hashes and urlhash not in self.refused_hashes:
+                    newUrls.append(url)
+            newUrls = list(dict.fromkeys(newUrls))
+        allowedUrls, deferredUrls, refusedUrls = self._robots_filter(newUrls)
+        with self.lock:
+            self.refused_hashes.update(get_urlhash(url) for url in refusedUrls)
+            if not allowedUrls and not deferredUrls:
                 return
             with shelve.open(self.config.save_file) as save:
-                self._add_url_to_save(save, url)
+                for url in allowedUrls:
+                    self._add_url_to_save(save, url)
+                for url, retryAt in deferredUrls:
+                    self._defer_url_to_save(save, url, retryAt)
+
+    # check deferred urls again, they are already in the save file
+    def _retry_deferred(self, urls):
+        allowedUrls, deferredUrls, refusedUrls = self._robots_filter(urls)
+        with self.lock:
+            with shelve.open(self.config.save_file) as save:
+                for url in allowedUrls:
+                    save[get_urlhash(url)] = (url, False)
+                    self.addToDomainQueue(url)
+                for url, retryAt in deferredUrls:
+                    self._defer(url, retryAt)
+                for url in refusedUrls:
+                    urlhash = get_urlhash(url)
+                    if urlhash in save:
+                        del save[urlhash]
+                    self.saved_hashes.discard(urlhash)
+                    self.refused_hashes.add(urlhash)
+
+    # split urls into allowed, deferred (url, retryAt) and refused by robots.txt.
+    # the first successful robots.txt of a host also seeds the frontier from its sitemaps
+    def _robots_filter(self, urls):
+        allowedUrls, deferredUrls, refusedUrls = [], [], []
+        for url in urls:
+            rules, seedSitemaps = self.robots.get(url)
+            if seedSitemaps and rules.sitemaps:
+                with self.lock:
+                    self.robotsInFlight += 1
+                Thread(
+                    target=self._seed_from_sitemaps,
+                    args=(urlparse(url).netloc, rules.sitemaps), daemon=True).start()
+
+            if rules.allowed(url):
+                allowedUrls.append(url)
+            elif rules.retryable:
+                deferredUrls.append((url, rules.expires))
+            else:
+                refusedUrls.append(url)
+                self.logger.info(f"Skipping {url}, disallowed by robots.txt.")
+        return allowedUrls, deferredUrls, refusedUrls
+
+    # sitemaps are read in the background so workers and startup don't wait on them
+    def _seed_from_sitemaps(self, domain, sitemaps):
+        try:
+            sitemapUrls = [url for url in self.robots.sitemap_urls(sitemaps) if is_valid(url)]
+            self.logger.info(f"Seeding {len(sitemapUrls)} urls from sitemaps of {domain}.")
+            self.add_urls(sitemapUrls)
+        except Exception as e:
+            self.logger.error(f"Error seeding from sitemaps of {domain}: {e}")
+        finally:
+            with self.lock:
+                self.robotsInFlight -= 1
+
+    # pop deferred urls whose robots.txt is due to be fetched again
+    def _take_deferred(self, currentTime):
+        due = [url for url, retryAt in self.deferredUrls.items() if retryAt <= currentTime]
+        for url in due:
+            del self.deferredUrls[url]
+        self.nextDeferredRetry = min(self.deferredUrls.values(), default=float("inf"))
+        return due
+
+    # wait for the domain's politeness slot before a robots.txt or sitemap
+    # download, and count the download as the domain's last access once it ends
+    @contextmanager
+    def _domain_slot(self, url):
+        domain = urlparse(url).netloc
+        while True:
+            with self.lock:
+                delay = max(self.config.time_delay, self.robots.crawl_delay(domain))
+                if time.time() - self.domainLastAccess.get(domain, 0) >= delay:
+                    self.domainLastAccess[domain] = time.time()
+                    break
+            time.sleep(0.1)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.domainLastAccess[domain] = time.time()
     
+    # record the outlinks of a crawled page in the link graph
+    def record_links(self, url, links):
+        sourceCount = self.linkGraph.add_links(url, links)
+        if sourceCount and sourceCount % GRAPH_SAVE_INTERVAL == 0:
+            Thread(target=self._checkpoint_graph, daemon=True).start()
+
+    # pagerank and save run in the background so the worker can move on
+    def _checkpoint_graph(self):
+        try:
+            rank = self.linkGraph.pagerank()
+            self.linkGraph.save()
+            self.logger.info(
+                f"Link graph: {len(self.linkGraph)} urls, "
+                f"{self.linkGraph.edge_count()} links. Top pages: "
+                + ", ".join(url for url, _ in self.linkGraph.top_pages(5, rank)))
+        except Exception as e:
+            self.logger.error(f"Error checkpointing link graph: {e}")
+
     # manage inProcessCount after worker finishes crawling a url
     def mark_url_complete(self, url):
         with self.lock:
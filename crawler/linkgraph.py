@@ -0,0 +1,175 @@
+import os
+import pickle
+
+from array import array
+from threading import RLock
+
+import numpy as np
+
+from utils import normalize
+
+# zero-copy view of an array("I") segment
+def _as_ndarray(segment):
+    if not segment:
+        return np.zeros(0, dtype=np.uint32)
+    return np.frombuffer(segment, dtype=np.uint32)
+
+class LinkGraph(object):
+    def __init__(self, path, restart, segmentSize=1 << 16):
+        self.path = path
+        self.segmentSize = segmentSize
+
+        # lock to protect the id maps, edge segments, and csr arrays
+        self.lock = RLock()
+        # serializes saves so an older snapshot never overwrites a newer one
+        self.saveLock = RLock()
+        self.urlIds = {}
+        self.urls = []
+        self.inDegree = array("I")
+        # 1 if a page's outlinks were already recorded, so edges are never duplicated
+        self.recorded = bytearray()
+        self.sourceCount = 0
+
+        # append-only edge segment, merged into csr form by _compact
+        self.pendingSrc = array("I")
+        self.pendingDst = array("I")
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.uint32)
+
+        if os.path.exists(self.path) and restart:
+            os.remove(self.path)
+        if os.path.exists(self.path):
+            self._load()
+
+    def __len__(self):
+        return len(self.urls)
+
+    def edge_count(self):
+        with self.lock:
+            return len(self.indices) + len(self.pendingSrc)
+
+    # map url to a dense integer id, allocating one on first sight
+    def _get_id(self, url):
+        nodeId = self.urlIds.get(url)
+        if nodeId is None:
+            nodeId = len(self.urls)
+            self.urlIds[url] = nodeId
+            self.urls.append(url)
+            self.inDegree.append(0)
+            self.recorded.append(0)
+        return nodeId
+
+    # record outlinks of a crawled page, in-degree is updated as edges arrive.
+    # returns the new sourceCount, or 0 if the page was already recorded
+    def add_links(self, url, links):
+        with self.lock:
+            src = self._get_id(normalize(url))
+            if self.recorded[src]:
+                return 0
+            self.recorded[src] = 1
+            self.sourceCount += 1
+
+            targets = set()
+            for link in links:
+                dst = self._get_id(normalize(link))
+                if dst != src:
+                    targets.add(dst)
+            for dst in targets:
+                self.pendingSrc.append(src)
+                self.pendingDst.append(dst)
+                self.inDegree[dst] += 1
+
+            if len(self.pendingSrc) >= self.segmentSize:
+                self._compact()
+            return self.sourceCount
+
+    def in_degree(self, url):
+        with self.lock:
+            nodeId = self.urlIds.get(normalize(url))
+            return self.inDegree[nodeId] if nodeId is not None else 0
+
+    # merge the pending segment into the csr arrays (rows sorted by source id)
+    def _compact(self):
+        if not self.pendingSrc and len(self.indptr) == len(self.urls) + 1:
+            return
+        n = len(self.urls)
+        oldSrc = np.repeat(
+            np.arange(len(self.indptr) - 1, dtype=np.uint32), np.diff(self.indptr))
+        src = np.concatenate([oldSrc, _as_ndarray(self.pendingSrc)])
+        dst = np.concatenate([self.indices, _as_ndarray(self.pendingDst)])
+
+        order = np.argsort(src, kind="stable")
+        self.indices = dst[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.indptr[1:])
+
+        self.pendingSrc = array("I")
+        self.pendingDst = array("I")
+
+    # power iteration over the csr graph, dangling rank is spread uniformly
+    def pagerank(self, damping=0.85, tol=1e-6, maxIter=100):
+        with self.lock:
+            self._compact()
+            n = len(self.urls)
+            if n == 0:
+                return np.zeros(0)
+            indptr, indices = self.indptr, self.indices
+
+        outDegree = np.diff(indptr)
+        src = np.repeat(np.arange(n, dtype=np.uint32), outDegree)
+        dangling = outDegree == 0
+        invOut = np.zeros(n)
+        invOut[~dangling] = 1.0 / outDegree[~dangling]
+
+        rank = np.full(n, 1.0 / n)
+        for _ in range(maxIter):
+            contrib = (rank * invOut)[src]
+            newRank = np.bincount(indices, weights=contrib, minlength=n)
+            newRank = damping * (newRank + rank[dangling].sum() / n) + (1.0 - damping) / n
+            delta = np.abs(newRank - rank).sum()
+            rank = newRank
+            if delta < tol:
+                break
+        return rank
+
+    # highest ranked urls, for reporting
+    def top_pages(self, count=10, rank=None):
+        if rank is None:
+            rank = self.pagerank()
+        count = min(count, len(rank))
+        if count == 0:
+            return []
+        best = np.argpartition(-rank, count - 1)[:count]
+        best = best[np.argsort(-rank[best])]
+        with self.lock:
+            return [(self.urls[i], float(rank[i])) for i in best]
+
+    # snapshot under the lock, then pickle and write atomically outside it so
+    # recording isn't stalled and an interrupted crawl never leaves a torn file
+    def save(self):
+        with self.saveLock:
+            with self.lock:
+                self._compact()
+                state = {
+                    "urls": self.urls[:],
+                    "inDegree": self.inDegree.tobytes(),
+                    "recorded": bytes(self.recorded),
+                    "indptr": self.indptr.tobytes(),
+                    "indices": self.indices.tobytes(),
+                }
+            tmpPath = f"{self.path}.tmp"
+            with open(tmpPath, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpPath, self.path)
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+        self.urls = state["urls"]
+        self.urlIds = {url: i for i, url in enumerate(self.urls)}
+        self.inDegree = array("I")
+        self.inDegree.frombytes(state["inDegree"])
+        self.recorded = bytearray(state["recorded"])
+        self.sourceCount = sum(self.recorded)
+        self.indptr = np.frombuffer(state["indptr"], dtype=np.int64).copy()
+        self.indices = np.frombuffer(state["indices"], dtype=np.uint32).copy()
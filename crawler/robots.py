@@ -0,0 +1,232 @@
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+
+from threading import RLock
+from urllib.parse import urlparse, urljoin
+
+from utils.download import download
+
+# how long a parsed robots.txt is trusted before it is downloaded again
+ROBOTS_TTL = 24 * 60 * 60
+# robots.txt that could not be fetched is retried sooner
+ROBOTS_ERROR_TTL = 10 * 60
+# cap on Crawl-delay so one host can't stall its queue indefinitely
+MAX_CRAWL_DELAY = 30.0
+# cap on sitemap documents (including nested sitemap indexes) read per host
+MAX_SITEMAPS = 20
+# after this many failed robots.txt fetches in a row the host is treated as having none
+MAX_ROBOTS_FAILURES = 3
+
+# robots.txt path pattern to regex: '*' matches anything, trailing '$' anchors
+def _compile_pattern(pattern):
+    anchored = pattern.endswith("$")
+    if anchored:
+        pattern = pattern[:-1]
+    regex = ".*".join(re.escape(part) for part in pattern.split("*"))
+    return re.compile(regex + ("$" if anchored else ""))
+
+class RobotsRules(object):
+    def __init__(self, rules=(), crawlDelay=0.0, sitemaps=(), disallowAll=False, ttl=ROBOTS_TTL,
+                 fetched=False, retryable=False):
+        # longest pattern wins, allow wins ties, so the first match in this order decides
+        self.rules = sorted(
+            ((_compile_pattern(pattern), allow, len(pattern)) for pattern, allow in rules),
+            key=lambda rule: (-rule[2], not rule[1]))
+        self.crawlDelay = crawlDelay
+        self.sitemaps = list(sitemaps)
+        self.disallowAll = disallowAll
+        self.expires = time.time() + ttl
+        # True if parsed from a 200 response
+        self.fetched = fetched
+        # True if urls refused by these rules should be retried once they expire
+        self.retryable = retryable
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if path == "/robots.txt":
+            return True
+        if self.disallowAll:
+            return False
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+        for regex, allow, _ in self.rules:
+            if regex.match(path):
+                return allow
+        return True
+
+    # keep only the groups naming our product token, else the '*' groups (RFC 9309)
+    @classmethod
+    def parse(cls, text, userAgent):
+        product = userAgent.split()[0].lower() if userAgent.split() else ""
+        groups = []
+        sitemaps = []
+        current = None
+        lastWasAgent = False
+
+        for line in text.splitlines():
+            line = line.split("#", 1)[0].strip()
+            if ":" not in line:
+                continue
+            field, value = line.split(":", 1)
+            field = field.strip().lower()
+            value = value.strip()
+
+            if field == "user-agent":
+                if not lastWasAgent:
+                    current = {"agents": [], "rules": [], "delay": None}
+                    groups.append(current)
+                current["agents"].append(value.lower())
+                lastWasAgent = True
+                continue
+            lastWasAgent = False
+
+            if field == "sitemap":
+                if value:
+                    sitemaps.append(value)
+            elif current is None:
+                continue
+            elif field in ("allow", "disallow"):
+                if value:
+                    current["rules"].append((value, field == "allow"))
+            elif field == "crawl-delay":
+                try:
+                    current["delay"] = float(value)
+                except ValueError:
+                    pass
+
+        matched = [group for group in groups if product and product in group["agents"]]
+        if not matched:
+            matched = [group for group in groups if "*" in group["agents"]]
+
+        rules = []
+        crawlDelay = 0.0
+        for group in matched:
+            rules.extend(group["rules"])
+            if group["delay"] is not None:
+                crawlDelay = max(crawlDelay, group["delay"])
+
+        return cls(rules, min(crawlDelay, MAX_CRAWL_DELAY), sitemaps, fetched=True)
+
+class RobotsCache(object):
+    # throttle(url) is an optional context manager wrapped around every download,
+    # so robots.txt and sitemap fetches follow the same per-domain politeness as pages
+    def __init__(self, config, logger, throttle=None):
+        self.config = config
+        self.logger = logger
+        self.throttle = throttle
+
+        # lock to protect hostRules, hostLocks, hostFailures and seededHosts,
+        # per-host locks guard the downloads
+        self.lock = RLock()
+        self.hostRules = {}
+        self.hostLocks = {}
+        self.hostFailures = {}
+        self.seededHosts = set()
+
+    # returns (rules, seedSitemaps), seedSitemaps is True only for the first
+    # successfully fetched robots.txt of a host
+    def get(self, url):
+        parsed = urlparse(url)
+        host = parsed.netloc
+        with self.lock:
+            rules = self.hostRules.get(host)
+            if rules and rules.expires > time.time():
+                return rules, False
+            hostLock = self.hostLocks.setdefault(host, RLock())
+
+        with hostLock:
+            with self.lock:
+                rules = self.hostRules.get(host)
+                if rules and rules.expires > time.time():
+                    return rules, False
+            rules = self._fetch(host, f"{parsed.scheme}://{host}/robots.txt")
+            with self.lock:
+                self.hostRules[host] = rules
+                seedSitemaps = rules.fetched and host not in self.seededHosts
+                if seedSitemaps:
+                    self.seededHosts.add(host)
+            return rules, seedSitemaps
+
+    def allowed(self, url):
+        return self.get(url)[0].allowed(url)
+
+    # only reads the cache, never downloads, so it is safe to call under the frontier lock
+    def crawl_delay(self, host):
+        with self.lock:
+            rules = self.hostRules.get(host)
+            return rules.crawlDelay if rules else 0.0
+
+    def _download(self, url):
+        if self.throttle is None:
+            return download(url, self.config, self.logger)
+        with self.throttle(url):
+            return download(url, self.config, self.logger)
+
+    # rules are unknown, so stay out of the host until retry, unless it keeps
+    # failing and has to be treated as having no robots.txt
+    def _unavailable(self, host, message):
+        with self.lock:
+            failures = self.hostFailures.get(host, 0) + 1
+            self.hostFailures[host] = failures
+        self.logger.error(message)
+        if failures >= MAX_ROBOTS_FAILURES:
+            return RobotsRules(ttl=ROBOTS_ERROR_TTL)
+        return RobotsRules(disallowAll=True, ttl=ROBOTS_ERROR_TTL, retryable=True)
+
+    def _fetch(self, host, robotsUrl):
+        try:
+            resp = self._download(robotsUrl)
+        except Exception as e:
+            return self._unavailable(host, f"Error downloading {robotsUrl}: {e}")
+
+        # only a 4xx says the host has no robots.txt. 3xx (redirect not followed),
+        # 5xx, the cache server's 6xx, or a 200 without a response leave the rules unknown
+        if 400 <= resp.status < 500:
+            rules = RobotsRules()
+        elif resp.status != 200 or resp.raw_response is None:
+            return self._unavailable(host, f"{robotsUrl} unavailable, status <{resp.status}>.")
+        else:
+            # an empty robots.txt is a real file with no rules
+            text = (resp.raw_response.content or b"").decode("utf-8", errors="ignore")
+            rules = RobotsRules.parse(text, self.config.user_agent)
+
+        with self.lock:
+            self.hostFailures.pop(host, None)
+        if not rules.fetched:
+            return rules
+        rules.sitemaps = [urljoin(robotsUrl, sitemap) for sitemap in rules.sitemaps]
+        self.logger.info(
+            f"Loaded {robotsUrl}: {len(rules.rules)} rules, "
+            f"crawl delay {rules.crawlDelay}, {len(rules.sitemaps)} sitemaps.")
+        return rules
+
+    # collect page urls from sitemaps, following sitemap indexes
+    def sitemap_urls(self, sitemaps):
+        pending = list(sitemaps)
+        seen = set()
+        urls = []
+        while pending and len(seen) < MAX_SITEMAPS:
+            sitemapUrl = pending.pop(0)
+            if sitemapUrl in seen:
+                continue
+            seen.add(sitemapUrl)
+            try:
+                resp = self._download(sitemapUrl)
+                if resp.status != 200 or not resp.raw_response or not resp.raw_response.content:
+                    continue
+                root = ElementTree.fromstring(resp.raw_response.content)
+            except Exception as e:
+                self.logger.error(f"Error reading sitemap {sitemapUrl}: {e}")
+                continue
+
+            isIndex = root.tag.endswith("sitemapindex")
+            for element in root.iter():
+                if element.tag.endswith("loc") and element.text:
+                    loc = element.text.strip()
+                    if isIndex:
+                        pending.append(loc)
+                    else:
+                        urls.append(loc)
+        return urls
@@ -37,13 +37,20 @@ class Worker(Thread):
                 f"Downloaded {tbdUrl}, status <{resp.status}>, "
                 f"using cache {self.config.cache_server}.")
             
+            scrapedUrls = None
             try:
                 # extract links from page and add to frontier
                 scrapedUrls = scraper.scraper(tbdUrl, resp)
-                for scrapedUrl in scrapedUrls:
-                    self.frontier.add_url(scrapedUrl)
+                self.frontier.add_urls(scrapedUrls)
             except Exception as e:
                 self.logger.error(f"Error scraping {tbdUrl}: {e}")
+
+            # graph errors are kept apart so they never cost the frontier its links
+            try:
+                if scrapedUrls is not None:
+                    self.frontier.record_links(tbdUrl, scrapedUrls)
+            except Exception as e:
+                self.logger.error(f"Error recording links of {tbdUrl}: {e}")
             # mark url as finished so frontier can continue
             finally:
                 self.frontier.mark_url_complete(tbdUrl)
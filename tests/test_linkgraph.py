@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from crawler.linkgraph import LinkGraph
+
+class LinkGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpDir, "frontier.shelve.graph")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir, ignore_errors=True)
+
+    def test_duplicate_and_self_links_are_dropped(self):
+        graph = LinkGraph(self.path, True)
+        self.assertEqual(graph.add_links("http://a/", ["http://b", "http://b/", "http://a"]), 1)
+        # a page's outlinks are only recorded once
+        self.assertEqual(graph.add_links("http://a", ["http://c"]), 0)
+
+        self.assertEqual(graph.edge_count(), 1)
+        self.assertEqual(graph.in_degree("http://b"), 1)
+        self.assertEqual(graph.in_degree("http://a"), 0)
+        self.assertEqual(graph.in_degree("http://c"), 0)
+
+    def test_in_degree_survives_compaction(self):
+        graph = LinkGraph(self.path, True, segmentSize=2)
+        graph.add_links("http://a", ["http://b", "http://c"])
+        self.assertEqual(len(graph.pendingSrc), 0)
+        graph.add_links("http://b", ["http://c"])
+        graph.add_links("http://d", ["http://c", "http://a"])
+        graph._compact()
+
+        self.assertEqual(graph.edge_count(), 5)
+        self.assertEqual(graph.in_degree("http://c"), 3)
+        self.assertEqual(graph.in_degree("http://a"), 1)
+        ids = graph.urlIds
+        row = graph.indices[graph.indptr[ids["http://d"]]:graph.indptr[ids["http://d"] + 1]]
+        self.assertEqual(sorted(row.tolist()), sorted([ids["http://c"], ids["http://a"]]))
+
+    def test_pagerank_matches_dense_reference(self):
+        graph = LinkGraph(self.path, True, segmentSize=3)
+        graph.add_links("http://a", ["http://b", "http://c"])
+        graph.add_links("http://b", ["http://c"])
+        graph.add_links("http://c", ["http://a", "http://d"])
+        # http://d is never crawled, so it is dangling
+        rank = graph.pagerank(tol=1e-12, maxIter=1000)
+        self.assertAlmostEqual(rank.sum(), 1.0)
+
+        n, damping = len(graph), 0.85
+        ids = graph.urlIds
+        transition = np.zeros((n, n))
+        for src, dsts in [("a", "bc"), ("b", "c"), ("c", "ad")]:
+            for dst in dsts:
+                transition[ids[f"http://{dst}"], ids[f"http://{src}"]] = 1.0 / len(dsts)
+        transition[:, ids["http://d"]] = 1.0 / n
+        google = damping * transition + (1.0 - damping) / n
+        values, vectors = np.linalg.eig(google)
+        expected = np.real(vectors[:, np.argmax(np.real(values))])
+        expected /= expected.sum()
+        np.testing.assert_allclose(rank, expected, atol=1e-9)
+
+    def test_save_and_load_round_trip(self):
+        graph = LinkGraph(self.path, True, segmentSize=2)
+        graph.add_links("http://a", ["http://b", "http://c"])
+        graph.add_links("http://b", ["http://c"])
+        graph.add_links("http://c", ["http://a"])
+        graph.save()
+
+        loaded = LinkGraph(self.path, False)
+        self.assertEqual(loaded.sourceCount, 3)
+        self.assertEqual(loaded.edge_count(), 4)
+        self.assertEqual(loaded.in_degree("http://c"), 2)
+        self.assertEqual(loaded.urls, graph.urls)
+        np.testing.assert_array_equal(loaded.indptr, graph.indptr)
+        np.testing.assert_array_equal(loaded.indices, graph.indices)
+        np.testing.assert_allclose(loaded.pagerank(), graph.pagerank())
+        self.assertEqual(loaded.add_links("http://a", ["http://d"]), 0)
+
+        self.assertFalse(os.path.exists(LinkGraph(self.path, True).path))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,290 @@
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import urlparse
+
+import requests
+
+from crawler.frontier import Frontier
+from crawler.robots import MAX_ROBOTS_FAILURES, RobotsCache, RobotsRules
+from utils import get_urlhash
+from utils.response import Response
+
+USER_AGENT = "IR UW26 59563288, 76836636"
+
+ICS_ROBOTS = """\
+User-agent: *
+Disallow: /private
+Crawl-delay: 1
+Sitemap: http://www.ics.uci.edu/sitemap_index.xml
+
+User-agent: 5
+Disallow: /
+"""
+
+SITEMAP_INDEX = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>http://www.ics.uci.edu/sitemap-pages.xml</loc></sitemap>
+</sitemapindex>
+"""
+
+ICS_SITEMAP = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>http://www.ics.uci.edu/people</loc></url>
+  <url><loc>http://www.ics.uci.edu/private/secret</loc></url>
+</urlset>
+"""
+
+STAT_ROBOTS = """\
+User-agent: *
+Disallow:
+Sitemap: http://www.stat.uci.edu/sitemap.xml
+"""
+
+STAT_SITEMAP = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>http://www.stat.uci.edu/courses</loc></url>
+</urlset>
+"""
+
+# serves a few fake uci hosts, picked by the Host header
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        host = self.headers["Host"]
+        with server.lock:
+            server.requestLog.append((host, self.path, time.time()))
+            hits = sum(1 for h, p, _ in server.requestLog if (h, p) == (host, self.path))
+
+        if host == "www.stat.uci.edu" and self.path == "/robots.txt" and hits == 1:
+            self._send(503, "unavailable")
+            return
+        pages = {
+            ("www.ics.uci.edu", "/robots.txt"): ICS_ROBOTS,
+            ("www.ics.uci.edu", "/sitemap_index.xml"): SITEMAP_INDEX,
+            ("www.ics.uci.edu", "/sitemap-pages.xml"): ICS_SITEMAP,
+            ("www.stat.uci.edu", "/robots.txt"): STAT_ROBOTS,
+            ("www.stat.uci.edu", "/sitemap.xml"): STAT_SITEMAP,
+        }
+        body = pages.get((host, self.path))
+        if body is None:
+            self._send(404, "not found")
+        else:
+            self._send(200, body)
+
+    def _send(self, status, body):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class RobotsFrontierTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSiteHandler)
+        cls.server.lock = threading.Lock()
+        cls.server.requestLog = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        with self.server.lock:
+            self.server.requestLog.clear()
+        self.cwd = os.getcwd()
+        self.tmpDir = tempfile.mkdtemp()
+        os.chdir(self.tmpDir)
+        patcher = mock.patch("crawler.robots.download", self._download)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpDir, ignore_errors=True)
+
+    # stands in for utils.download.download, the cache server is replaced by the local site
+    def _download(self, url, config, logger=None):
+        parsed = urlparse(url)
+        port = self.server.server_address[1]
+        resp = requests.get(
+            f"http://127.0.0.1:{port}{parsed.path or '/'}", headers={"Host": parsed.netloc})
+        return Response({"url": url, "status": resp.status_code, "response": pickle.dumps(resp)})
+
+    def _config(self, seedUrls):
+        return SimpleNamespace(
+            user_agent=USER_AGENT, save_file=os.path.join(self.tmpDir, "frontier.shelve"),
+            seed_urls=seedUrls, time_delay=0.1, cache_server=None)
+
+    def _wait_for_seeding(self, frontier, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with frontier.lock:
+                if frontier.robotsInFlight == 0:
+                    return
+            time.sleep(0.05)
+        self.fail("sitemap seeding did not finish")
+
+    def _requests_to(self, host):
+        with self.server.lock:
+            return [(path, at) for h, path, at in self.server.requestLog if h == host]
+
+    def test_sitemaps_seed_frontier_and_robots_filters(self):
+        frontier = Frontier(self._config(["http://www.ics.uci.edu"]), True)
+        self._wait_for_seeding(frontier)
+
+        queued = frontier.domainQueues["www.ics.uci.edu"]
+        self.assertIn("http://www.ics.uci.edu", queued)
+        self.assertIn("http://www.ics.uci.edu/people", queued)
+        self.assertNotIn("http://www.ics.uci.edu/private/secret", queued)
+
+        frontier.add_url("http://www.ics.uci.edu/private/other")
+        self.assertNotIn("http://www.ics.uci.edu/private/other", queued)
+
+        # robots.txt is fetched once, sitemaps follow at the host's Crawl-delay
+        fetches = self._requests_to("www.ics.uci.edu")
+        self.assertEqual(
+            [path for path, _ in fetches],
+            ["/robots.txt", "/sitemap_index.xml", "/sitemap-pages.xml"])
+        for (_, previous), (_, current) in zip(fetches, fetches[1:]):
+            self.assertGreaterEqual(current - previous, 0.9)
+
+    def test_crawl_delay_spaces_scheduled_urls(self):
+        frontier = Frontier(self._config(["http://www.ics.uci.edu"]), True)
+        self._wait_for_seeding(frontier)
+
+        first = frontier.get_tbd_url()
+        frontier.mark_url_complete(first)
+        start = time.time()
+        second = frontier.get_tbd_url()
+        frontier.mark_url_complete(second)
+        self.assertNotEqual(first, second)
+        self.assertGreaterEqual(time.time() - start, 0.8)
+
+    def test_unavailable_robots_defers_urls_until_retry(self):
+        with mock.patch("crawler.robots.ROBOTS_ERROR_TTL", 0.3):
+            frontier = Frontier(self._config(["http://www.stat.uci.edu"]), True)
+            self.assertEqual(frontier.domainQueues.get("www.stat.uci.edu", []), [])
+            self.assertIn("http://www.stat.uci.edu", frontier.deferredUrls)
+
+            # the seed comes back once robots.txt can be fetched again
+            self.assertEqual(frontier.get_tbd_url(), "http://www.stat.uci.edu")
+            frontier.mark_url_complete("http://www.stat.uci.edu")
+            self._wait_for_seeding(frontier)
+
+        # sitemaps are still read even though the first robots.txt fetch failed
+        self.assertIn("http://www.stat.uci.edu/courses", frontier.domainQueues["www.stat.uci.edu"])
+        self.assertEqual(
+            [path for path, _ in self._requests_to("www.stat.uci.edu")],
+            ["/robots.txt", "/robots.txt", "/sitemap.xml"])
+
+    def test_deferred_urls_survive_resume(self):
+        config = self._config(["http://www.stat.uci.edu"])
+        frontier = Frontier(config, True)
+        self.assertIn("http://www.stat.uci.edu", frontier.deferredUrls)
+
+        # a resumed crawl defers the url again and retries robots.txt right away
+        resumed = Frontier(config, False)
+        self.assertIn("http://www.stat.uci.edu", resumed.deferredUrls)
+        self.assertEqual(resumed.get_tbd_url(), "http://www.stat.uci.edu")
+        resumed.mark_url_complete("http://www.stat.uci.edu")
+        self._wait_for_seeding(resumed)
+
+    def test_refused_urls_are_not_checked_again(self):
+        frontier = Frontier(self._config(["http://www.ics.uci.edu"]), True)
+        self._wait_for_seeding(frontier)
+
+        frontier.add_url("http://www.ics.uci.edu/private/nav")
+        self.assertIn(get_urlhash("http://www.ics.uci.edu/private/nav"), frontier.refused_hashes)
+        with mock.patch.object(frontier.robots, "get", wraps=frontier.robots.get) as robotsGet:
+            frontier.add_urls(["http://www.ics.uci.edu/private/nav"] * 3)
+            robotsGet.assert_not_called()
+
+class RobotsCacheTest(unittest.TestCase):
+    def setUp(self):
+        config = SimpleNamespace(user_agent=USER_AGENT)
+        self.cache = RobotsCache(config, logging.getLogger("RobotsCacheTest"))
+
+    def _fetch_with(self, download):
+        with mock.patch("crawler.robots.download", download):
+            return self.cache._fetch("h", "http://h/robots.txt")
+
+    def _respond(self, status, content=None):
+        raw = None
+        if content is not None:
+            raw = requests.Response()
+            raw.status_code = status
+            raw._content = content
+        resp = Response({"url": "http://h/robots.txt", "status": status, "response": pickle.dumps(raw)})
+        return lambda url, config, logger=None: resp
+
+    def test_unreachable_robots_is_treated_as_unavailable(self):
+        def unreachable(url, config, logger=None):
+            raise requests.ConnectionError("cache server down")
+
+        for _ in range(MAX_ROBOTS_FAILURES - 1):
+            rules = self._fetch_with(unreachable)
+            self.assertTrue(rules.retryable)
+            self.assertFalse(rules.allowed("http://h/page"))
+        # a host that keeps failing is treated as having no robots.txt
+        rules = self._fetch_with(unreachable)
+        self.assertFalse(rules.retryable)
+        self.assertTrue(rules.allowed("http://h/page"))
+
+    def test_only_4xx_means_no_robots(self):
+        for status in (301, 503, 601):
+            rules = self._fetch_with(self._respond(status, b""))
+            self.assertTrue(rules.retryable, status)
+            self.cache.hostFailures.clear()
+        rules = self._fetch_with(self._respond(200))
+        self.assertTrue(rules.retryable)
+
+        rules = self._fetch_with(self._respond(404, b"missing"))
+        self.assertFalse(rules.retryable)
+        self.assertTrue(rules.allowed("http://h/page"))
+        self.assertEqual(self.cache.hostFailures, {})
+
+        # an empty file is a real robots.txt without rules
+        rules = self._fetch_with(self._respond(200, b""))
+        self.assertTrue(rules.fetched)
+        self.assertTrue(rules.allowed("http://h/page"))
+
+class RobotsRulesTest(unittest.TestCase):
+    def test_groups_match_product_token(self):
+        rules = RobotsRules.parse(ICS_ROBOTS, USER_AGENT)
+        self.assertTrue(rules.allowed("http://www.ics.uci.edu/"))
+        self.assertFalse(rules.allowed("http://www.ics.uci.edu/private/x"))
+
+        rules = RobotsRules.parse("User-agent: ir\nDisallow: /x\n\nUser-agent: *\nDisallow: /\n", USER_AGENT)
+        self.assertTrue(rules.allowed("http://www.ics.uci.edu/y"))
+        self.assertFalse(rules.allowed("http://www.ics.uci.edu/x"))
+
+    def test_longest_match_wins(self):
+        rules = RobotsRules.parse(
+            "User-agent: *\nDisallow: /a\nAllow: /a/b$\nDisallow: /*.php$\n", USER_AGENT)
+        self.assertTrue(rules.allowed("http://h/a/b"))
+        self.assertFalse(rules.allowed("http://h/a/bc"))
+        self.assertFalse(rules.allowed("http://h/index.php"))
+        self.assertTrue(rules.allowed("http://h/index.php?x=1"))
+        self.assertTrue(rules.allowed("http://h/robots.txt"))
+
+if __name__ == "__main__":
+    unittest.main()